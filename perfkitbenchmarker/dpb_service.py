@@ -20,9 +20,16 @@ the corresponding provider directory as a subclass of BaseDpbService.
 """
 
 import abc
+import collections
 import datetime
 import logging
+import posixpath
+import random
+import shlex
+import threading
+import time
 from typing import Dict, List, Optional
+import uuid
 
 from absl import flags
 import dataclasses
@@ -49,6 +56,11 @@ flags.DEFINE_string('dpb_service_zone', None, 'The zone for provisioning the '
                     'dpb_service instance.')
 flags.DEFINE_list('dpb_job_properties', [], 'A list of strings of the form '
                   '"key=vale" to be passed into DBP jobs.')
+flags.DEFINE_float(
+    'dpb_max_job_poll_interval', 30,
+    'Maximum number of seconds to wait between polls for DPB job completion. '
+    'The poll interval backs off exponentially from the job\'s poll interval '
+    'up to this value.', lower_bound=0)
 flags.DEFINE_list(
     'dpb_cluster_properties', [], 'A list of strings of the form '
     '"type:key=value" to be passed into DBP clusters. See '
@@ -72,6 +84,14 @@ DEFAULT_WORKER_COUNT = 2
 FLINK = 'flink'
 HIVE = 'hive'
 
+# Growth factor and maximum relative jitter of the interval between polls in
+# BaseDpbService._WaitForJob.
+_JOB_POLL_BACKOFF_FACTOR = 1.5
+_JOB_POLL_JITTER = 0.1
+
+# Lines of a failed unmanaged job's stderr to include in JobSubmissionError.
+_JOB_STDERR_TAIL_LINES = 20
+
 # Metrics and Status related metadata
 # TODO(pclay): Remove these after migrating all callers to SubmitJob
 SUCCESS = 'success'
@@ -143,6 +163,12 @@ class BaseDpbService(resource.BaseResource):
       }
   }
 
+  # Dpb services in the same run share the pkb-<run_uri> bucket, so count its
+  # users: the first one to be created makes it and the last one deleted
+  # removes it.
+  _bucket_lock = threading.Lock()
+  _bucket_users = collections.Counter()
+
   def __init__(self, dpb_service_spec):
     """Initialize the Dpb service object.
 
@@ -164,6 +190,12 @@ class BaseDpbService(resource.BaseResource):
     self.dpb_version = dpb_service_spec.version
     self.dpb_service_type = 'unknown'
     self.storage_service = None
+    # Parsed lazily from --dpb_job_properties by GetJobProperties.
+    self._job_properties = None
+    # Populated by GetMetadata.
+    self._metadata_cache = None
+    self._metadata_cache_key = None
+    self._uses_bucket = False
 
   @property
   def base_dir(self):
@@ -212,19 +244,37 @@ class BaseDpbService(resource.BaseResource):
     pass
 
   def _WaitForJob(self, job_id, timeout, poll_interval):
+    """Polls _GetCompletedJob until the job completes.
+
+    The interval between polls backs off exponentially from poll_interval, with
+    jitter, up to --dpb_max_job_poll_interval.
+
+    Args:
+      job_id: The id of the job to wait for.
+      timeout: The number of seconds to wait before giving up.
+      poll_interval: The initial number of seconds between polls.
+
+    Returns:
+      The JobResult of the completed job.
 
-    @vm_util.Retry(
-        timeout=timeout,
-        poll_interval=poll_interval,
-        fuzz=0,
-        retryable_exceptions=(JobNotCompletedError,))
-    def Poll():
+    Raises:
+      JobNotCompletedError if the job does not complete within timeout.
+      JobSubmissionError if the job fails.
+    """
+    deadline = time.time() + timeout
+    max_poll_interval = max(poll_interval, FLAGS.dpb_max_job_poll_interval)
+    while True:
       result = self._GetCompletedJob(job_id)
-      if result is None:
+      if result is not None:
+        return result
+      sleep_time = poll_interval * (1 + random.random() * _JOB_POLL_JITTER)
+      if time.time() + sleep_time >= deadline:
         raise JobNotCompletedError('Job {} not complete.'.format(job_id))
-      return result
-
-    return Poll()
+      logging.info('Job %s not complete. Polling again in %.1fs.', job_id,
+                   sleep_time)
+      time.sleep(sleep_time)
+      poll_interval = min(poll_interval * _JOB_POLL_BACKOFF_FACTOR,
+                          max_poll_interval)
 
   def _GetCompletedJob(self, job_id: str) -> Optional[JobResult]:
     """Get the job result if it has finished.
@@ -267,6 +317,18 @@ class BaseDpbService(resource.BaseResource):
 
   def GetMetadata(self):
     """Return a dictionary of the metadata for this cluster."""
+    # Only these attributes change after __init__ (e.g. in _Create), so the
+    # metadata is rebuilt only when one of them does.
+    cache_key = (self.dpb_service_type, self.dpb_version, self.cluster_id,
+                 self.dpb_hdfs_type)
+    if self._metadata_cache_key != cache_key:
+      self._metadata_cache = self._BuildMetadata()
+      self._metadata_cache_key = cache_key
+    # Callers add their own metadata to the result, so return a copy.
+    return dict(self._metadata_cache)
+
+  def _BuildMetadata(self):
+    """Builds the dictionary returned by GetMetadata."""
     pretty_version = self.dpb_version or 'default'
     basic_data = {
         'dpb_service': self.dpb_service_type,
@@ -286,15 +348,29 @@ class BaseDpbService(resource.BaseResource):
 
   def _CreateDependencies(self):
     """Creates a bucket to use with the cluster."""
-    self.storage_service.MakeBucket(self.bucket)
+    with self._bucket_lock:
+      if self._uses_bucket:
+        return
+      if not BaseDpbService._bucket_users[self.bucket]:
+        self.storage_service.MakeBucket(self.bucket)
+      BaseDpbService._bucket_users[self.bucket] += 1
+      self._uses_bucket = True
 
   def _Create(self):
     """Creates the underlying resource."""
     raise NotImplementedError()
 
   def _DeleteDependencies(self):
-    """Deletes the bucket used with the cluster."""
-    self.storage_service.DeleteBucket(self.bucket)
+    """Deletes the bucket used with the cluster once no service uses it."""
+    with self._bucket_lock:
+      if not self._uses_bucket:
+        return
+      self._uses_bucket = False
+      BaseDpbService._bucket_users[self.bucket] -= 1
+      if BaseDpbService._bucket_users[self.bucket] > 0:
+        return
+      del BaseDpbService._bucket_users[self.bucket]
+      self.storage_service.DeleteBucket(self.bucket)
 
   def _Delete(self):
     """Deletes the underlying resource.
@@ -322,9 +398,15 @@ class BaseDpbService(resource.BaseResource):
       raise ValueError('start_time cannot be later than the end_time')
     return (end_time - start_time).total_seconds()
 
-  def GetJobProperties(self):
+  def GetJobProperties(self) -> Dict[str, str]:
     """Parse the dpb_job_properties_flag."""
-    return dict(pair.split('=') for pair in FLAGS.dpb_job_properties)
+    if self._job_properties is None:
+      self._job_properties = {
+          key: value for key, _, value in (
+              pair.partition('=') for pair in FLAGS.dpb_job_properties)
+      }
+    # Callers merge their own properties into the result, so return a copy.
+    return dict(self._job_properties)
 
   def GetExecutionJar(self, job_category, job_type):
     """Retrieve execution jar corresponding to the job_category and job_type.
@@ -376,6 +458,59 @@ class UnmanagedDpbService(BaseDpbService):
     # set in _Create of derived classes
     self.leader = None
 
+  def _InstallStorageConnector(self, vm):
+    """Installs the Hadoop connector for the cluster's object storage."""
+    if self.cloud == 'GCP':
+      hadoop.InstallGcsConnector(vm)
+    elif self.cloud == 'AWS':
+      hadoop.InstallS3Connector(vm)
+
+  def _RunJobOnLeader(self, cmd_string, job_stdout_file=None):
+    """Runs a blocking job submission command on the leader.
+
+    The job's stdout and stderr are redirected to separate files on the
+    leader rather than being returned over SSH. Stdout is only copied back if
+    job_stdout_file is set. The tail of stderr is logged if the job succeeds
+    and included in the error if it fails. Both files are removed afterwards.
+
+    Args:
+      cmd_string: The job submission command to run.
+      job_stdout_file: Local path to copy the job's standard out to, if any.
+
+    Returns:
+      A JobResult with the wall time of the job.
+
+    Raises:
+      JobSubmissionError if the job fails.
+    """
+    remote_job_file = posixpath.join(vm_util.VM_TMP_DIR,
+                                     'job_{}'.format(uuid.uuid4()))
+    remote_stdout_file = remote_job_file + '.stdout'
+    remote_stderr_file = remote_job_file + '.stderr'
+    tail_cmd = 'tail -n {} {}'.format(_JOB_STDERR_TAIL_LINES,
+                                      remote_stderr_file)
+    try:
+      start_time = datetime.datetime.now()
+      try:
+        self.leader.RobustRemoteCommand('{} > {} 2> {}'.format(
+            cmd_string, remote_stdout_file, remote_stderr_file))
+      except errors.VirtualMachine.RemoteCommandError as e:
+        stderr_tail, _ = self.leader.RemoteCommand(
+            tail_cmd, ignore_failure=True)
+        raise JobSubmissionError(stderr_tail) from e
+      end_time = datetime.datetime.now()
+
+      # Keep the end of the driver output in the PKB log.
+      self.leader.RemoteCommand(
+          tail_cmd, should_log=True, ignore_failure=True)
+      if job_stdout_file:
+        self.leader.PullFile(job_stdout_file, remote_stdout_file)
+    finally:
+      self.leader.RemoteCommand(
+          'rm -f {} {}'.format(remote_stdout_file, remote_stderr_file),
+          ignore_failure=True)
+    return JobResult(run_time=(end_time - start_time).total_seconds())
+
 
 class UnmanagedDpbServiceYarnCluster(UnmanagedDpbService):
   """Object representing an un-managed dpb service yarn cluster."""
@@ -402,10 +537,7 @@ class UnmanagedDpbServiceYarnCluster(UnmanagedDpbService):
 
     def InstallHadoop(vm):
       vm.Install('hadoop')
-      if self.cloud == 'GCP':
-        hadoop.InstallGcsConnector(vm)
-      if self.cloud == 'AWS':
-        hadoop.InstallS3Connector(vm)
+      self._InstallStorageConnector(vm)
 
     if 'worker_group' not in self.vms:
       raise errors.Resource.CreationError(
@@ -434,30 +566,22 @@ class UnmanagedDpbServiceYarnCluster(UnmanagedDpbService):
     cmd_list = [hadoop.HADOOP_CMD]
     # Order is important
     if jarfile:
+      # jarfile is not quoted so that globs in JOB_JARS expand on the leader.
       cmd_list += ['jar', jarfile]
     # Specifying classname only works if jarfile is omitted or if it has no
     # main class.
     if classname:
-      cmd_list += [classname]
+      cmd_list += [shlex.quote(classname)]
     all_properties = self.GetJobProperties()
     all_properties.update(properties or {})
-    cmd_list += ['-D{}={}'.format(k, v) for k, v in all_properties.items()]
+    cmd_list += [
+        shlex.quote('-D{}={}'.format(k, v)) for k, v in all_properties.items()
+    ]
     if job_arguments:
-      cmd_list += job_arguments
+      cmd_list += [shlex.quote(arg) for arg in job_arguments]
     cmd_string = ' '.join(cmd_list)
 
-    start_time = datetime.datetime.now()
-    try:
-      stdout, _ = self.leader.RobustRemoteCommand(
-          cmd_string, should_log=True)
-    except errors.VirtualMachine.RemoteCommandError as e:
-      raise JobSubmissionError() from e
-    end_time = datetime.datetime.now()
-
-    if job_stdout_file:
-      with open(job_stdout_file, 'w') as f:
-        f.write(stdout)
-    return JobResult(run_time=(end_time - start_time).total_seconds())
+    return self._RunJobOnLeader(cmd_string, job_stdout_file)
 
   def _Delete(self):
     pass
@@ -493,10 +617,7 @@ class UnmanagedDpbSparkCluster(UnmanagedDpbService):
 
     def InstallSpark(vm):
       vm.Install('spark')
-      if self.cloud == 'GCP':
-        hadoop.InstallGcsConnector(vm)
-      if self.cloud == 'AWS':
-        hadoop.InstallS3Connector(vm)
+      self._InstallStorageConnector(vm)
 
     if 'worker_group' not in self.vms:
       raise errors.Resource.CreationError(
@@ -530,35 +651,25 @@ class UnmanagedDpbSparkCluster(UnmanagedDpbService):
     cmd = [spark.SPARK_SUBMIT]
     # Order is important
     if classname:
-      cmd += ['--class', classname]
+      cmd += ['--class', shlex.quote(classname)]
     all_properties = self.GetJobProperties()
     all_properties.update(properties or {})
     for k, v in all_properties.items():
-      cmd += ['--conf', '{}={}'.format(k, v)]
+      cmd += ['--conf', shlex.quote('{}={}'.format(k, v))]
     if job_files:
-      cmd = ['--files', ','.join(job_files)]
+      cmd += ['--files', shlex.quote(','.join(job_files))]
     # Main jar/script goes last before args.
     if job_type == BaseDpbService.SPARK_JOB_TYPE:
       assert jarfile
+      # jarfile is not quoted so that globs in JOB_JARS expand on the leader.
       cmd.append(jarfile)
     elif job_type == BaseDpbService.PYSPARK_JOB_TYPE:
       assert pyspark_file
-      cmd.append(pyspark_file)
+      cmd.append(shlex.quote(pyspark_file))
     if job_arguments:
-      cmd += job_arguments
+      cmd += [shlex.quote(arg) for arg in job_arguments]
 
-    start_time = datetime.datetime.now()
-    try:
-      stdout, _ = self.leader.RobustRemoteCommand(
-          ' '.join(cmd), should_log=True)
-    except errors.VirtualMachine.RemoteCommandError as e:
-      raise JobSubmissionError() from e
-    end_time = datetime.datetime.now()
-
-    if job_stdout_file:
-      with open(job_stdout_file, 'w') as f:
-        f.write(stdout)
-    return JobResult(run_time=(end_time - start_time).total_seconds())
+    return self._RunJobOnLeader(' '.join(cmd), job_stdout_file)
 
   def _Delete(self):
     pass
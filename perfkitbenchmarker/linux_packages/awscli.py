@@ -12,23 +12,42 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-"""Package for installing the AWS CLI."""
+"""Package for installing the AWS CLI.
+
+Installs the self-contained awscli v2 bundle, see
+https://docs.aws.amazon.com/cli/latest/userguide/install-cliv2-linux.html.
+"""
 
 from perfkitbenchmarker import errors
 
-# TODO(user): Migrate to awscli v2, see
-# https://docs.aws.amazon.com/cli/latest/userguide/cliv2-migration.html.
-# TODO(user): Updating to v1 head will not work since awscli stopped
-# support of python 3.5 which python3-pip sometimes installs. We should find a
-# way to pin this version to 3.7 which would probably involve changing the
-# python 3 linux package.
-_VERSION = '1.18.107'
+_BUNDLE_URL = 'https://awscli.amazonaws.com/awscli-exe-linux-{arch}.zip'
+# Architectures (as reported by uname -m) that have a published v2 bundle.
+_SUPPORTED_ARCHS = frozenset(['x86_64', 'aarch64'])
+_BUNDLE_ZIP = '/tmp/awscliv2.zip'
+_BUNDLE_DIR = '/tmp/aws'
+_INSTALL_DIR = '/usr/local/aws-cli'
+_BIN_DIR = '/usr/local/bin'
+
+
+def _GetBundleUrl(vm):
+  """Returns the awscli v2 bundle URL matching the VM's architecture."""
+  arch = vm.RemoteCommand('uname -m')[0].strip()
+  if arch not in _SUPPORTED_ARCHS:
+    raise errors.Setup.InvalidSetupError(
+        f'awscli v2 does not support architecture {arch!r}.')
+  return _BUNDLE_URL.format(arch=arch)
 
 
 def Install(vm):
   """Installs the awscli package on the VM."""
-  vm.InstallPackages('python3-pip')
-  vm.RemoteCommand(f"sudo pip3 install 'awscli=={_VERSION}' --force-reinstall")
+  vm.Install('unzip')
+  vm.Install('curl')
+  vm.RemoteCommand(
+      f'curl -sSL {_GetBundleUrl(vm)} -o {_BUNDLE_ZIP} && '
+      f'rm -rf {_BUNDLE_DIR} && unzip -q {_BUNDLE_ZIP} -d /tmp && '
+      f'sudo {_BUNDLE_DIR}/install --update '
+      f'-i {_INSTALL_DIR} -b {_BIN_DIR} && '
+      f'rm -rf {_BUNDLE_ZIP} {_BUNDLE_DIR}')
 
 
 def YumInstall(vm):
@@ -42,4 +61,5 @@ def YumInstall(vm):
 
 
 def Uninstall(vm):
-  vm.RemoteCommand('/usr/bin/yes | sudo pip3 uninstall awscli')
+  vm.RemoteCommand(f'sudo rm -rf {_INSTALL_DIR} {_BIN_DIR}/aws '
+                   f'{_BIN_DIR}/aws_completer')
@@ -32,12 +32,18 @@ from perfkitbenchmarker.linux_packages import aws_credentials
 FLAGS = flags.FLAGS
 
 flags.DEFINE_string('hadoop_version', '3.2.1', 'Version of hadoop.')
+flags.DEFINE_string('hadoop_bin_url', None,
+                    'Specify to override url from HADOOP_URL_BASE. Useful for '
+                    'pointing large clusters at an in-region mirror of the '
+                    'Hadoop release tarball.')
 
 DATA_FILES = ['hadoop/core-site.xml.j2', 'hadoop/yarn-site.xml.j2',
               'hadoop/hdfs-site.xml', 'hadoop/mapred-site.xml.j2',
               'hadoop/hadoop-env.sh.j2', 'hadoop/workers.j2']
 START_HADOOP_SCRIPT = 'hadoop/start-hadoop.sh.j2'
 
+HADOOP_URL_BASE = 'https://www-us.apache.org/dist/hadoop/common'
+
 HADOOP_DIR = posixpath.join(linux_packages.INSTALL_DIR, 'hadoop')
 HADOOP_BIN = posixpath.join(HADOOP_DIR, 'bin')
 HADOOP_SBIN = posixpath.join(HADOOP_DIR, 'sbin')
@@ -61,14 +67,20 @@ def CheckPrerequisites():
     data.ResourcePath(resource)
 
 
+def HadoopUrl():
+  """Returns the URL of the Hadoop release tarball to install."""
+  if FLAGS.hadoop_bin_url:
+    return FLAGS.hadoop_bin_url
+  return '{0}/hadoop-{1}/hadoop-{1}.tar.gz'.format(HADOOP_URL_BASE,
+                                                    FLAGS.hadoop_version)
+
+
 def _Install(vm):
   vm.Install('openjdk')
   vm.Install('curl')
-  hadoop_url = ('https://www-us.apache.org/dist/hadoop/common/hadoop-{0}/'
-                'hadoop-{0}.tar.gz').format(FLAGS.hadoop_version)
   vm.RemoteCommand(('mkdir {0} && curl -L {1} | '
                     'tar -C {0} --strip-components=1 -xzf -').format(
-                        HADOOP_DIR, hadoop_url))
+                        HADOOP_DIR, HadoopUrl()))
 
 
 def YumInstall(vm):
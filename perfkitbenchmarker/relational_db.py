@@ -17,12 +17,10 @@ from abc import abstractmethod
 import random
 import re
 import string
-import uuid
 
 from absl import flags
 from perfkitbenchmarker import resource
 from perfkitbenchmarker import vm_util
-import six
 
 # TODO(ferneyhough): change to enum
 flags.DEFINE_string('managed_db_engine', None,
@@ -96,10 +94,10 @@ flags.DEFINE_integer('innodb_log_file_size', 1000,
                      'Size of the log file in MB. Defaults to 1000M.')
 
 
-BACKUP_TIME_REGULAR_EXPRESSION = '^\d\d\:\d\d$'
+_BACKUP_TIME_RE = re.compile(r'^\d\d:\d\d$')
 flags.register_validator(
     'managed_db_backup_start_time',
-    lambda value: re.search(BACKUP_TIME_REGULAR_EXPRESSION, value) is not None,
+    lambda value: _BACKUP_TIME_RE.match(value) is not None,
     message=('--database_backup_start_time must be in the form HH:MM'))
 
 MYSQL = 'mysql'
@@ -128,6 +126,34 @@ FLAGS = flags.FLAGS
 
 # TODO: Implement DEFAULT BACKUP_START_TIME for instances.
 
+# Managed databases can be reachable from outside the run's network, so
+# generated passwords are drawn from the OS's entropy source.
+_PASSWORD_RNG = random.SystemRandom()
+
+# Maps supported MySQL major.minor versions to the PKB packages to install.
+_MYSQL_SERVER_PACKAGES = {
+    '5.6': 'mysql56',
+    '5.7': 'mysql57',
+    '8.0': 'mysql80',
+}
+_MYSQL_CLIENT_PACKAGES = {
+    '5.6': 'mysqlclient56',
+    '5.7': 'mysqlclient',
+    '8.0': 'mysqlclient',
+}
+
+# Applied to the client and server VMs of unmanaged MySQL so that idle
+# benchmark connections are not dropped.
+_TCP_KEEPALIVE_SYSCTLS = {
+    'net.ipv4.tcp_keepalive_time': 100,
+    'net.ipv4.tcp_keepalive_intvl': 100,
+    'net.ipv4.tcp_keepalive_probes': 10
+}
+
+# Default for getattr lookups of spec attributes that may be absent, so that
+# absent attributes can be told apart from ones explicitly set to None.
+_MISSING = object()
+
 
 class RelationalDbPropertyNotSet(Exception):
   pass
@@ -151,10 +177,16 @@ def GenerateRandomDbPassword():
   Returns:
     A random database password.
   """
-  prefix = [random.choice(string.ascii_lowercase),
-            random.choice(string.ascii_uppercase),
-            random.choice(string.digits)]
-  return ''.join(prefix) + str(uuid.uuid4())[:10]
+  prefix = [_PASSWORD_RNG.choice(string.ascii_lowercase),
+            _PASSWORD_RNG.choice(string.ascii_uppercase),
+            _PASSWORD_RNG.choice(string.digits)]
+  suffix = _PASSWORD_RNG.choices(string.ascii_letters + string.digits, k=10)
+  return ''.join(prefix + suffix)
+
+
+def _GetMajorMinorVersion(engine_version):
+  """Returns the major.minor part of a version string, e.g. 5.7 for 5.7.16."""
+  return '.'.join(engine_version.split('.')[:2])
 
 
 def GetRelationalDbClass(cloud):
@@ -171,11 +203,13 @@ def GetRelationalDbClass(cloud):
 
 def VmsToBoot(vm_groups):
   # TODO(jerlawson): Enable replications.
+  wanted_groups = {'clients', 'default'}
+  if not FLAGS.use_managed_db:
+    wanted_groups.add('servers')
   return {
-      name: spec  # pylint: disable=g-complex-comprehension
-      for name, spec in six.iteritems(vm_groups)
-      if name == 'clients' or name == 'default' or
-      (not FLAGS.use_managed_db and name == 'servers')
+      name: spec
+      for name, spec in vm_groups.items()
+      if name in wanted_groups
   }
 
 
@@ -195,6 +229,7 @@ class BaseRelationalDb(resource.BaseResource):
     """
     super(BaseRelationalDb, self).__init__()
     self.spec = relational_db_spec
+    self._engine_major_minor_version = None
     if not FLAGS.use_managed_db:
       if self.spec.high_availability:
         raise UnsupportedError('High availability is unsupported for unmanaged '
@@ -326,60 +361,41 @@ class BaseRelationalDb(resource.BaseResource):
     }
 
     if not self.is_managed_db:
-      metadata.update({
-          'unmanaged_db_innodb_buffer_pool_size_gb':
-              self.innodb_buffer_pool_size,
-          'unmanaged_db_innodb_log_file_size_mb':
-              self.innodb_log_file_size,
-      })
-
-    if (hasattr(self.spec.db_spec, 'machine_type') and
-        self.spec.db_spec.machine_type):
-      metadata.update({
-          'machine_type': self.spec.db_spec.machine_type,
-      })
-    elif hasattr(self.spec.db_spec, 'cpus') and (hasattr(
-        self.spec.db_spec, 'memory')):
-      metadata.update({
-          'cpus': self.spec.db_spec.cpus,
-      })
-      metadata.update({
-          'memory': self.spec.db_spec.memory,
-      })
-    elif hasattr(self.spec.db_spec, 'tier') and (hasattr(
-        self.spec.db_spec, 'compute_units')):
-      metadata.update({
-          'tier': self.spec.db_spec.tier,
-      })
-      metadata.update({
-          'compute_units': self.spec.db_spec.compute_units,
-      })
+      metadata['unmanaged_db_innodb_buffer_pool_size_gb'] = (
+          self.innodb_buffer_pool_size)
+      metadata['unmanaged_db_innodb_log_file_size_mb'] = (
+          self.innodb_log_file_size)
+
+    db_spec = self.spec.db_spec
+    db_machine_type = getattr(db_spec, 'machine_type', None)
+    if db_machine_type:
+      metadata['machine_type'] = db_machine_type
+    elif (getattr(db_spec, 'cpus', _MISSING) is not _MISSING and
+          getattr(db_spec, 'memory', _MISSING) is not _MISSING):
+      metadata['cpus'] = db_spec.cpus
+      metadata['memory'] = db_spec.memory
+    elif (getattr(db_spec, 'tier', _MISSING) is not _MISSING and
+          getattr(db_spec, 'compute_units', _MISSING) is not _MISSING):
+      metadata['tier'] = db_spec.tier
+      metadata['compute_units'] = db_spec.compute_units
     else:
       raise RelationalDbPropertyNotSet(
           'Machine type of the database must be set.')
 
-    if (hasattr(self.spec.vm_groups['clients'].vm_spec, 'machine_type') and
-        self.spec.vm_groups['clients'].vm_spec.machine_type):
-      metadata.update({
-          'client_vm_machine_type':
-              self.spec.vm_groups['clients'].vm_spec.machine_type,
-      })
-    elif hasattr(self.spec.vm_groups['clients'].vm_spec, 'cpus') and (hasattr(
-        self.spec.vm_groups['clients'].vm_spec, 'memory')):
-      metadata.update({
-          'client_vm_cpus': self.spec.vm_groups['clients'].vm_spec.cpus,
-      })
-      metadata.update({
-          'client_vm_memory': self.spec.vm_groups['clients'].vm_spec.memory,
-      })
+    client_vm_spec = self.spec.vm_groups['clients'].vm_spec
+    client_machine_type = getattr(client_vm_spec, 'machine_type', None)
+    if client_machine_type:
+      metadata['client_vm_machine_type'] = client_machine_type
+    elif (getattr(client_vm_spec, 'cpus', _MISSING) is not _MISSING and
+          getattr(client_vm_spec, 'memory', _MISSING) is not _MISSING):
+      metadata['client_vm_cpus'] = client_vm_spec.cpus
+      metadata['client_vm_memory'] = client_vm_spec.memory
     else:
       raise RelationalDbPropertyNotSet(
           'Machine type of the client VM must be set.')
 
     if FLAGS.db_flags:
-      metadata.update({
-          'db_flags': FLAGS.db_flags,
-      })
+      metadata['db_flags'] = FLAGS.db_flags
 
     return metadata
 
@@ -396,6 +412,27 @@ class BaseRelationalDb(resource.BaseResource):
   def _PostCreate(self):
     self._ApplyDbFlags()
 
+  def _GetMysqlPackage(self, packages):
+    """Returns the package in packages for the MySQL engine version.
+
+    Args:
+      packages: dict mapping major.minor versions to package names.
+
+    Returns:
+      The name of the package to install.
+
+    Raises:
+      Exception: If the engine version is unsupported.
+    """
+    if self._engine_major_minor_version is None:
+      self._engine_major_minor_version = _GetMajorMinorVersion(
+          self.spec.engine_version)
+    try:
+      return packages[self._engine_major_minor_version]
+    except KeyError:
+      raise Exception('Invalid database engine version: %s. Only 5.6, 5.7 '
+                      'and 8.0 are supported.' % self.spec.engine_version)
+
   def _IsReadyUnmanaged(self):
     """Return true if the underlying resource is ready.
 
@@ -409,18 +446,7 @@ class BaseRelationalDb(resource.BaseResource):
     if self.is_managed_db:
       raise Exception('Checking state of unmanaged database when the database '
                       'is managed.')
-    if (self.spec.engine_version == '5.6' or
-        self.spec.engine_version.startswith('5.6.')):
-      mysql_name = 'mysql56'
-    elif (self.spec.engine_version == '5.7' or
-          self.spec.engine_version.startswith('5.7.')):
-      mysql_name = 'mysql57'
-    elif (self.spec.engine_version == '8.0' or
-          self.spec.engine_version.startswith('8.0.')):
-      mysql_name = 'mysql80'
-    else:
-      raise Exception('Invalid database engine version: %s. Only 5.6 and 5.7 '
-                      'and 8.0 are supported.' % self.spec.engine_version)
+    mysql_name = self._GetMysqlPackage(_MYSQL_SERVER_PACKAGES)
     stdout, stderr = self.server_vm.RemoteCommand(
         'sudo service %s status' % self.server_vm.GetServiceName(mysql_name))
     return stdout and not stderr
@@ -431,64 +457,55 @@ class BaseRelationalDb(resource.BaseResource):
     Raises:
       Exception: If the requested engine version is unsupported.
     """
-    if (self.spec.engine_version == '5.6' or
-        self.spec.engine_version.startswith('5.6.')):
-      mysql_name = 'mysqlclient56'
-    elif (self.spec.engine_version == '5.7' or
-          self.spec.engine_version.startswith('5.7') or
-          self.spec.engine_version == '8.0' or
-          self.spec.engine_version.startswith('8.0')):
-      mysql_name = 'mysqlclient'
-    else:
-      raise Exception('Invalid database engine version: %s. Only 5.6, 5.7 '
-                      'and 8.0 are supported.' % self.spec.engine_version)
+    mysql_name = self._GetMysqlPackage(_MYSQL_CLIENT_PACKAGES)
     self.client_vm.Install(mysql_name)
+    config_path = self.client_vm.GetPathToConfig(mysql_name)
     self.client_vm.RemoteCommand(
         'sudo sed -i '
         '"s/max_allowed_packet\t= 16M/max_allowed_packet\t= 1024M/g" %s' %
-        self.client_vm.GetPathToConfig(mysql_name))
-    self.client_vm.RemoteCommand(
-        'sudo cat %s' % self.client_vm.GetPathToConfig(mysql_name),
-        should_log=True)
-
-  def _PrepareDataDirectories(self, mysql_name):
-    # Make the data directories in case they don't already exist.
-    self.server_vm.RemoteCommand('sudo mkdir -p /scratch/mysql')
-    self.server_vm.RemoteCommand('sudo mkdir -p /scratch/tmp')
-    self.server_vm.RemoteCommand('sudo chown mysql:mysql /scratch/mysql')
-    self.server_vm.RemoteCommand('sudo chown mysql:mysql /scratch/tmp')
-    # Copy all the contents of the default data directories to the new ones.
-    self.server_vm.RemoteCommand(
-        'sudo rsync -avzh /var/lib/mysql/ /scratch/mysql')
-    self.server_vm.RemoteCommand('sudo rsync -avzh /tmp/ /scratch/tmp')
-    self.server_vm.RemoteCommand('df', should_log=True)
-    # Configure AppArmor.
-    self.server_vm.RemoteCommand(
+        config_path)
+    self.client_vm.RemoteCommand('sudo cat %s' % config_path, should_log=True)
+
+  def _PrepareDataDirectories(self, config_path):
+    """Moves the MySQL data and tmp directories to /scratch.
+
+    All steps are issued as a single remote command to avoid paying for a
+    separate SSH round trip per step.
+
+    Args:
+      config_path: path to the MySQL server config file on the server vm.
+    """
+    self.server_vm.RemoteCommand(' && '.join([
+        # Make the data directories in case they don't already exist.
+        'sudo mkdir -p /scratch/mysql',
+        'sudo mkdir -p /scratch/tmp',
+        'sudo chown mysql:mysql /scratch/mysql',
+        'sudo chown mysql:mysql /scratch/tmp',
+        # Copy all the contents of the default data directories to the new
+        # ones.
+        'sudo rsync -avzh /var/lib/mysql/ /scratch/mysql',
+        'sudo rsync -avzh /tmp/ /scratch/tmp',
+        # Configure AppArmor.
         'echo "alias /var/lib/mysql -> /scratch/mysql," | sudo tee -a '
-        '/etc/apparmor.d/tunables/alias')
-    self.server_vm.RemoteCommand(
+        '/etc/apparmor.d/tunables/alias',
         'echo "alias /tmp -> /scratch/tmp," | sudo tee -a '
-        '/etc/apparmor.d/tunables/alias')
-    self.server_vm.RemoteCommand(
+        '/etc/apparmor.d/tunables/alias',
         'sudo sed -i '
         '"s|# Allow data files dir access|'
         '  /scratch/mysql/ r, /scratch/mysql/** rwk, /scratch/tmp/ r, '
         '/scratch/tmp/** rwk, /proc/*/status r, '
         '/sys/devices/system/node/ r, /sys/devices/system/node/node*/meminfo r,'
         ' /sys/devices/system/node/*/* r, /sys/devices/system/node/* r, '
-        '# Allow data files dir access|g" /etc/apparmor.d/usr.sbin.mysqld')
-    self.server_vm.RemoteCommand(
-        'sudo apparmor_parser -r /etc/apparmor.d/usr.sbin.mysqld')
-    self.server_vm.RemoteCommand('sudo systemctl restart apparmor')
-    # Finally, change the MySQL data directory.
-    self.server_vm.RemoteCommand(
-        'sudo sed -i '
-        '"s|datadir\t\t= /var/lib/mysql|datadir\t\t= /scratch/mysql|g" '
-        '%s' % self.server_vm.GetPathToConfig(mysql_name))
-    self.server_vm.RemoteCommand(
+        '# Allow data files dir access|g" /etc/apparmor.d/usr.sbin.mysqld',
+        'sudo apparmor_parser -r /etc/apparmor.d/usr.sbin.mysqld',
+        'sudo systemctl restart apparmor',
+        # Finally, change the MySQL data directory.
         'sudo sed -i '
-        '"s|tmpdir\t\t= /tmp|tmpdir\t\t= /scratch/tmp|g" '
-        '%s' % self.server_vm.GetPathToConfig(mysql_name))
+        '-e "s|datadir\t\t= /var/lib/mysql|datadir\t\t= /scratch/mysql|g" '
+        '-e "s|tmpdir\t\t= /tmp|tmpdir\t\t= /scratch/tmp|g" '
+        '%s' % config_path,
+    ]))
+    self.server_vm.RemoteCommand('df', should_log=True)
 
   def _InstallMySQLServer(self):
     """Installs MySQL Server on the server vm.
@@ -505,96 +522,64 @@ class BaseRelationalDb(resource.BaseResource):
       raise Exception('Can\'t install MySQL Server when using a managed '
                       'database.')
     if self.client_vm.IS_REBOOTABLE:
-      self.client_vm.ApplySysctlPersistent({
-          'net.ipv4.tcp_keepalive_time': 100,
-          'net.ipv4.tcp_keepalive_intvl': 100,
-          'net.ipv4.tcp_keepalive_probes': 10
-      })
+      self.client_vm.ApplySysctlPersistent(_TCP_KEEPALIVE_SYSCTLS)
     if self.server_vm.IS_REBOOTABLE:
-      self.server_vm.ApplySysctlPersistent({
-          'net.ipv4.tcp_keepalive_time': 100,
-          'net.ipv4.tcp_keepalive_intvl': 100,
-          'net.ipv4.tcp_keepalive_probes': 10
-      })
-    if (self.spec.engine_version == '5.6' or
-        self.spec.engine_version.startswith('5.6.')):
-      mysql_name = 'mysql56'
-    elif (self.spec.engine_version == '5.7' or
-          self.spec.engine_version.startswith('5.7.')):
-      mysql_name = 'mysql57'
-    elif (self.spec.engine_version == '8.0' or
-          self.spec.engine_version.startswith('8.0.')):
-      mysql_name = 'mysql80'
-    else:
-      raise Exception('Invalid database engine version: %s. Only 5.6 and 5.7 '
-                      'and 8.0 are supported.' % self.spec.engine_version)
+      self.server_vm.ApplySysctlPersistent(_TCP_KEEPALIVE_SYSCTLS)
+    mysql_name = self._GetMysqlPackage(_MYSQL_SERVER_PACKAGES)
     self.server_vm.Install(mysql_name)
+    config_path = self.server_vm.GetPathToConfig(mysql_name)
+    service_name = self.server_vm.GetServiceName(mysql_name)
     self.server_vm.RemoteCommand('chmod 777 %s' %
                                  self.server_vm.GetScratchDir())
-    self.server_vm.RemoteCommand('sudo service %s stop' %
-                                 self.server_vm.GetServiceName(mysql_name))
-    self._PrepareDataDirectories(mysql_name)
+    self.server_vm.RemoteCommand('sudo service %s stop' % service_name)
+    self._PrepareDataDirectories(config_path)
 
     # Minimal MySQL tuning; see AWS whitepaper in docstring.
     innodb_buffer_pool_gb = self.innodb_buffer_pool_size
     innodb_log_file_mb = self.innodb_log_file_size
 
-    self.server_vm.RemoteCommand(
+    self.server_vm.RemoteCommand(' && '.join([
         'echo "\n'
         f'innodb_buffer_pool_size = {innodb_buffer_pool_gb}G\n'
         'innodb_flush_method = O_DIRECT\n'
         'innodb_flush_neighbors = 0\n'
         f'innodb_log_file_size = {innodb_log_file_mb}M'
-        '" | sudo tee -a %s' % self.server_vm.GetPathToConfig(mysql_name))
-
-    # These (and max_connections after restarting) help avoid losing connection.
-    self.server_vm.RemoteCommand(
+        '" | sudo tee -a %s' % config_path,
+        # These (and max_connections after restarting) help avoid losing
+        # connection.
         'echo "\nskip-name-resolve\n'
         'connect_timeout        = 86400\n'
         'wait_timeout        = 86400\n'
-        'interactive_timeout        = 86400" | sudo tee -a %s' %
-        self.server_vm.GetPathToConfig(mysql_name))
-    self.server_vm.RemoteCommand('sudo sed -i "s/bind-address/#bind-address/g" '
-                                 '%s' %
-                                 self.server_vm.GetPathToConfig(mysql_name))
-    self.server_vm.RemoteCommand(
+        'interactive_timeout        = 86400" | sudo tee -a %s' % config_path,
+        'sudo sed -i "s/bind-address/#bind-address/g" %s' % config_path,
         'sudo sed -i '
         '"s/max_allowed_packet\t= 16M/max_allowed_packet\t= 1024M/g" %s' %
-        self.server_vm.GetPathToConfig(mysql_name))
-
-    # Configure logging (/var/log/mysql/error.log will print upon db deletion).
-    self.server_vm.RemoteCommand(
+        config_path,
+        # Configure logging (/var/log/mysql/error.log will print upon db
+        # deletion).
         'echo "\nlog_error_verbosity        = 3" | sudo tee -a %s' %
-        self.server_vm.GetPathToConfig(mysql_name))
+        config_path,
+    ]))
     self.server_vm.RemoteCommand(
         'sudo cat /etc/mysql/mysql.conf.d/mysql.sock',
         should_log=True,
         ignore_failure=True)
     # Restart.
-    self.server_vm.RemoteCommand('sudo service %s restart' %
-                                 self.server_vm.GetServiceName(mysql_name))
-    self.server_vm.RemoteCommand(
-        'sudo cat %s' % self.server_vm.GetPathToConfig(mysql_name),
-        should_log=True)
+    self.server_vm.RemoteCommand('sudo service %s restart' % service_name)
+    self.server_vm.RemoteCommand('sudo cat %s' % config_path, should_log=True)
 
-    self.server_vm.RemoteCommand(
-        'mysql %s -e "SET GLOBAL max_connections=8000;"' %
-        self.MakeMysqlConnectionString(use_localhost=True))
     if FLAGS.ip_addresses == vm_util.IpAddressSubset.INTERNAL:
       client_ip = self.client_vm.internal_ip
     else:
       client_ip = self.client_vm.ip_address
     self.server_vm.RemoteCommand(
-        ('mysql %s -e "CREATE USER \'%s\'@\'%s\' IDENTIFIED BY \'%s\';"') %
-        (self.MakeMysqlConnectionString(use_localhost=True),
-         self.spec.database_username, client_ip, self.spec.database_password))
-    self.server_vm.RemoteCommand(
-        ('mysql %s -e "GRANT ALL PRIVILEGES ON *.* TO \'%s\'@\'%s\';"') %
+        ('mysql %s -e "SET GLOBAL max_connections=8000; '
+         'CREATE USER \'%s\'@\'%s\' IDENTIFIED BY \'%s\'; '
+         'GRANT ALL PRIVILEGES ON *.* TO \'%s\'@\'%s\'; '
+         'FLUSH PRIVILEGES;"') %
         (self.MakeMysqlConnectionString(use_localhost=True),
+         self.spec.database_username, client_ip, self.spec.database_password,
          self.spec.database_username, client_ip))
-    self.server_vm.RemoteCommand(
-        'mysql %s -e "FLUSH PRIVILEGES;"' %
-        self.MakeMysqlConnectionString(use_localhost=True))
 
   def _ApplyDbFlags(self):
     """Apply Flags on the database."""
@@ -614,11 +599,23 @@ class BaseRelationalDb(resource.BaseResource):
                               type(self).__name__)
 
   def _ApplyMySqlFlags(self):
+    """Applies --db_flags on the unmanaged MySQL server.
+
+    The statements run on the server vm, since root is only granted access
+    from localhost and the client vm.
+
+    Raises:
+      Exception: if a flag could not be set.
+    """
     if FLAGS.db_flags:
+      connection_string = self.MakeMysqlConnectionString(use_localhost=True)
       for flag in FLAGS.db_flags:
-        cmd = 'mysql %s -e \'SET %s;\'' % self.MakeMysqlConnectionString(), flag
-        _, stderr, _ = vm_util.IssueCommand(cmd, raise_on_failure=False)
-        if stderr:
+        # The mysql client always warns about passwords on the command line,
+        # so failures are detected by the return code rather than stderr.
+        _, stderr, retcode = self.server_vm.RemoteCommandWithReturnCode(
+            f'mysql {connection_string} -e "SET {flag};"',
+            ignore_failure=True)
+        if retcode:
           raise Exception('Invalid MySQL flags: %s' % stderr)
 
   def Failover(self):
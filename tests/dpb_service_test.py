@@ -0,0 +1,236 @@
+# Copyright 2021 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.dpb_service."""
+
+import collections
+import random
+import re
+import time
+import unittest
+from absl import flags
+from absl.testing import flagsaver
+import mock
+
+from perfkitbenchmarker import dpb_service
+from perfkitbenchmarker import errors
+from tests import pkb_common_test_case
+
+TEST_RUN_URI = 'fakeru'
+GCP_ZONE_US_CENTRAL1_A = 'us-central1-a'
+
+FLAGS = flags.FLAGS
+
+CLUSTER_SPEC = mock.Mock(
+    static_dpb_service_instance=None,
+    worker_count=2,
+    version=None,
+    worker_group=mock.Mock(
+        cloud='GCP',
+        vm_spec=mock.Mock(machine_type='fake-machine-type')))
+
+
+def _GetRemoteJobFiles(cmd):
+  """Returns the remote stdout and stderr files a job command writes to."""
+  return re.search(r' > (\S+\.stdout) 2> (\S+\.stderr)$', cmd).groups()
+
+
+class UnmanagedDpbSparkClusterTest(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(UnmanagedDpbSparkClusterTest, self).setUp()
+    FLAGS.run_uri = TEST_RUN_URI
+    FLAGS.dpb_service_zone = GCP_ZONE_US_CENTRAL1_A
+    self.cluster = dpb_service.UnmanagedDpbSparkCluster(CLUSTER_SPEC)
+    self.cluster.leader = mock.Mock()
+
+  @flagsaver.flagsaver(dpb_job_properties=['a=b', 'c=d=e'])
+  def testGetJobProperties(self):
+    self.assertEqual({'a': 'b', 'c': 'd=e'}, self.cluster.GetJobProperties())
+
+  @flagsaver.flagsaver(dpb_job_properties=['a=b', 'flag'])
+  def testGetJobPropertiesWithoutValue(self):
+    self.assertEqual({'a': 'b', 'flag': ''}, self.cluster.GetJobProperties())
+
+  @flagsaver.flagsaver(dpb_job_properties=['a=b'])
+  def testGetJobPropertiesReturnsCopy(self):
+    self.cluster.GetJobProperties()['a'] = 'mutated'
+    self.assertEqual({'a': 'b'}, self.cluster.GetJobProperties())
+
+  def testGetMetadata(self):
+    metadata = self.cluster.GetMetadata()
+    self.assertEqual('pkb-fakeru', metadata['dpb_cluster_id'])
+    metadata['dpb_cluster_id'] = 'mutated'
+    self.assertEqual('pkb-fakeru',
+                     self.cluster.GetMetadata()['dpb_cluster_id'])
+
+  def testGetMetadataUpdatesAfterCreate(self):
+    self.assertIsNone(self.cluster.GetMetadata()['dpb_hdfs_type'])
+    self.cluster.cluster_id = 'j-12345'
+    self.cluster.dpb_hdfs_type = 'Local SSD'
+    metadata = self.cluster.GetMetadata()
+    self.assertEqual('j-12345', metadata['dpb_cluster_id'])
+    self.assertEqual('Local SSD', metadata['dpb_hdfs_type'])
+
+  def testSubmitJobRedirectsOutputOnLeader(self):
+    self.cluster.SubmitJob(
+        jarfile='job.jar',
+        classname='org.example.Job',
+        job_type=dpb_service.BaseDpbService.SPARK_JOB_TYPE)
+    cmd = self.cluster.leader.RobustRemoteCommand.call_args[0][0]
+    self.assertRegex(
+        cmd, r'^/opt/pkb/spark/bin/spark-submit --class org.example.Job '
+        r'job.jar > /tmp/pkb/job_.*\.stdout 2> /tmp/pkb/job_.*\.stderr$')
+    self.cluster.leader.PullFile.assert_not_called()
+    remote_stdout_file, remote_stderr_file = _GetRemoteJobFiles(cmd)
+    self.assertEqual([
+        mock.call('tail -n 20 ' + remote_stderr_file, should_log=True,
+                  ignore_failure=True),
+        mock.call('rm -f {} {}'.format(remote_stdout_file, remote_stderr_file),
+                  ignore_failure=True),
+    ], self.cluster.leader.RemoteCommand.call_args_list)
+
+  @flagsaver.flagsaver(
+      dpb_job_properties=['spark.driver.extraJavaOptions=-Da -Db'])
+  def testSubmitJobQuotesArguments(self):
+    self.cluster.SubmitJob(
+        jarfile=self.cluster.GetExecutionJar('spark', 'examples'),
+        job_arguments=['a b', 'c'],
+        job_type=dpb_service.BaseDpbService.SPARK_JOB_TYPE)
+    cmd = self.cluster.leader.RobustRemoteCommand.call_args[0][0]
+    self.assertStartsWith(
+        cmd, "/opt/pkb/spark/bin/spark-submit "
+        "--conf 'spark.driver.extraJavaOptions=-Da -Db' "
+        "/opt/pkb/spark/examples/jars/spark-examples_*.jar 'a b' c > ")
+
+  def testSubmitJobWithFiles(self):
+    self.cluster.SubmitJob(
+        pyspark_file='job.py',
+        classname='org.example.Job',
+        job_files=['a.txt', 'b.txt'],
+        job_arguments=['arg'],
+        job_type=dpb_service.BaseDpbService.PYSPARK_JOB_TYPE)
+    cmd = self.cluster.leader.RobustRemoteCommand.call_args[0][0]
+    self.assertStartsWith(
+        cmd, '/opt/pkb/spark/bin/spark-submit --class org.example.Job '
+        '--files a.txt,b.txt job.py arg > ')
+
+  def testSubmitJobPullsStdoutFile(self):
+    self.cluster.SubmitJob(
+        jarfile='job.jar',
+        job_stdout_file='/tmp/local.stdout',
+        job_type=dpb_service.BaseDpbService.SPARK_JOB_TYPE)
+    cmd = self.cluster.leader.RobustRemoteCommand.call_args[0][0]
+    remote_stdout_file, _ = _GetRemoteJobFiles(cmd)
+    self.cluster.leader.PullFile.assert_called_once_with(
+        '/tmp/local.stdout', remote_stdout_file)
+
+  def testSubmitJobFailure(self):
+    self.cluster.leader.RobustRemoteCommand.side_effect = (
+        errors.VirtualMachine.RemoteCommandError('failed'))
+    self.cluster.leader.RemoteCommand.return_value = ('Exception in main', '')
+    with self.assertRaisesRegex(dpb_service.JobSubmissionError,
+                                'Exception in main'):
+      self.cluster.SubmitJob(
+          jarfile='job.jar',
+          job_stdout_file='/tmp/local.stdout',
+          job_type=dpb_service.BaseDpbService.SPARK_JOB_TYPE)
+    cmd = self.cluster.leader.RobustRemoteCommand.call_args[0][0]
+    remote_stdout_file, remote_stderr_file = _GetRemoteJobFiles(cmd)
+    self.cluster.leader.PullFile.assert_not_called()
+    self.assertEqual([
+        mock.call('tail -n 20 ' + remote_stderr_file, ignore_failure=True),
+        mock.call('rm -f {} {}'.format(remote_stdout_file, remote_stderr_file),
+                  ignore_failure=True),
+    ], self.cluster.leader.RemoteCommand.call_args_list)
+
+  @mock.patch.object(dpb_service.BaseDpbService, '_bucket_users',
+                     collections.Counter())
+  def testSharedBucketCreatedAndDeletedOnce(self):
+    other_cluster = dpb_service.UnmanagedDpbSparkCluster(CLUSTER_SPEC)
+    storage_service = mock.Mock()
+    self.cluster.storage_service = storage_service
+    other_cluster.storage_service = storage_service
+
+    self.cluster._CreateDependencies()
+    other_cluster._CreateDependencies()
+    storage_service.MakeBucket.assert_called_once_with('pkb-fakeru')
+
+    self.cluster._DeleteDependencies()
+    self.cluster._DeleteDependencies()
+    # The other cluster is still using the bucket.
+    storage_service.DeleteBucket.assert_not_called()
+
+    other_cluster._DeleteDependencies()
+    storage_service.DeleteBucket.assert_called_once_with('pkb-fakeru')
+
+  @flagsaver.flagsaver(dpb_max_job_poll_interval=10)
+  @mock.patch.object(random, 'random', return_value=0)
+  @mock.patch.object(time, 'sleep')
+  def testWaitForJobBacksOff(self, mock_sleep, _):
+    job_result = dpb_service.JobResult(run_time=1)
+    with mock.patch.object(
+        self.cluster, '_GetCompletedJob',
+        side_effect=[None, None, None, None, job_result]):
+      self.assertEqual(job_result,
+                       self.cluster._WaitForJob('job', 3600, poll_interval=4))
+    self.assertEqual([mock.call(4), mock.call(6), mock.call(9), mock.call(10)],
+                     mock_sleep.call_args_list)
+
+  @mock.patch.object(time, 'sleep')
+  def testWaitForJobTimeout(self, _):
+    with mock.patch.object(self.cluster, '_GetCompletedJob', return_value=None):
+      with self.assertRaises(dpb_service.JobNotCompletedError):
+        self.cluster._WaitForJob('job', 1, poll_interval=5)
+
+
+class UnmanagedDpbServiceYarnClusterTest(
+    pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(UnmanagedDpbServiceYarnClusterTest, self).setUp()
+    FLAGS.run_uri = TEST_RUN_URI
+    FLAGS.dpb_service_zone = GCP_ZONE_US_CENTRAL1_A
+    self.cluster = dpb_service.UnmanagedDpbServiceYarnCluster(CLUSTER_SPEC)
+    self.cluster.leader = mock.Mock()
+
+  @flagsaver.flagsaver(dpb_job_properties=['mapreduce.opts=-Da -Db'])
+  def testSubmitJob(self):
+    self.cluster.SubmitJob(
+        jarfile=self.cluster.GetExecutionJar('hadoop', 'terasort'),
+        classname='terasort',
+        job_arguments=['in dir', 'out'],
+        job_stdout_file='/tmp/local.stdout',
+        job_type=dpb_service.BaseDpbService.HADOOP_JOB_TYPE)
+    cmd = self.cluster.leader.RobustRemoteCommand.call_args[0][0]
+    self.assertStartsWith(
+        cmd, '/opt/pkb/hadoop/bin/hadoop jar '
+        '/opt/pkb/hadoop/share/hadoop/mapreduce/'
+        'hadoop-mapreduce-examples-*.jar terasort '
+        "'-Dmapreduce.opts=-Da -Db' 'in dir' out > ")
+    remote_stdout_file, remote_stderr_file = _GetRemoteJobFiles(cmd)
+    self.cluster.leader.PullFile.assert_called_once_with(
+        '/tmp/local.stdout', remote_stdout_file)
+    self.cluster.leader.RemoteCommand.assert_called_with(
+        'rm -f {} {}'.format(remote_stdout_file, remote_stderr_file),
+        ignore_failure=True)
+
+  def testSubmitJobRejectsOtherJobTypes(self):
+    with self.assertRaises(NotImplementedError):
+      self.cluster.SubmitJob(
+          jarfile='job.jar',
+          job_type=dpb_service.BaseDpbService.SPARK_JOB_TYPE)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,54 @@
+# Copyright 2021 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.linux_packages.awscli."""
+
+import unittest
+from absl.testing import parameterized
+import mock
+from perfkitbenchmarker import errors
+from perfkitbenchmarker.linux_packages import awscli
+
+
+class AwscliTest(parameterized.TestCase):
+
+  def setUp(self):
+    super(AwscliTest, self).setUp()
+    self.vm = mock.Mock()
+
+  @parameterized.parameters('x86_64', 'aarch64')
+  def testInstall(self, arch):
+    self.vm.RemoteCommand.side_effect = [(arch + '\n', ''), ('', '')]
+    awscli.Install(self.vm)
+    self.assertEqual([mock.call('unzip'), mock.call('curl')],
+                     self.vm.Install.call_args_list)
+    install_cmd = self.vm.RemoteCommand.call_args_list[1][0][0]
+    self.assertIn(
+        f'curl -sSL https://awscli.amazonaws.com/awscli-exe-linux-{arch}.zip',
+        install_cmd)
+    self.assertIn('sudo /tmp/aws/install --update', install_cmd)
+
+  def testInstallUnsupportedArch(self):
+    self.vm.RemoteCommand.return_value = ('ppc64le\n', '')
+    with self.assertRaises(errors.Setup.InvalidSetupError):
+      awscli.Install(self.vm)
+
+  def testYumInstallAlreadyInstalled(self):
+    self.vm.RemoteCommand.return_value = ('awscli.noarch', '')
+    awscli.YumInstall(self.vm)
+    self.vm.RemoteCommand.assert_called_once_with('yum list installed awscli')
+    self.vm.Install.assert_not_called()
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,261 @@
+# Copyright 2021 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.relational_db."""
+
+import unittest
+from absl import flags
+from absl.testing import flagsaver
+from absl.testing import parameterized
+import mock
+
+from perfkitbenchmarker import relational_db
+from tests import pkb_common_test_case
+
+FLAGS = flags.FLAGS
+
+
+class FakeRelationalDb(relational_db.BaseRelationalDb):
+
+  def GetDefaultEngineVersion(self, engine):
+    return '5.7'
+
+  def _Create(self):
+    pass
+
+  def _Delete(self):
+    pass
+
+  def _FailoverHA(self):
+    pass
+
+
+class GetMysqlPackageTest(pkb_common_test_case.PkbCommonTestCase):
+
+  def _CreateDb(self, engine_version):
+    return FakeRelationalDb(
+        mock.Mock(
+            high_availability=False,
+            engine=relational_db.MYSQL,
+            engine_version=engine_version))
+
+  @parameterized.parameters(
+      ('5.6', 'mysql56', 'mysqlclient56'),
+      ('5.6.40', 'mysql56', 'mysqlclient56'),
+      ('5.7', 'mysql57', 'mysqlclient'),
+      ('5.7.16', 'mysql57', 'mysqlclient'),
+      ('8.0', 'mysql80', 'mysqlclient'),
+      ('8.0.21', 'mysql80', 'mysqlclient'),
+  )
+  def testSupportedVersion(self, version, server_package, client_package):
+    db = self._CreateDb(version)
+    self.assertEqual(server_package,
+                     db._GetMysqlPackage(relational_db._MYSQL_SERVER_PACKAGES))
+    self.assertEqual(client_package,
+                     db._GetMysqlPackage(relational_db._MYSQL_CLIENT_PACKAGES))
+
+  @parameterized.parameters('5', '5.5', '5.70', '9.6')
+  def testUnsupportedVersion(self, version):
+    db = self._CreateDb(version)
+    with self.assertRaisesRegex(
+        Exception, 'Invalid database engine version: %s' % version):
+      db._GetMysqlPackage(relational_db._MYSQL_SERVER_PACKAGES)
+
+  def testVersionParsedOnce(self):
+    db = self._CreateDb('5.7.16')
+    with mock.patch.object(
+        relational_db, '_GetMajorMinorVersion',
+        wraps=relational_db._GetMajorMinorVersion) as mock_parse:
+      db._GetMysqlPackage(relational_db._MYSQL_SERVER_PACKAGES)
+      db._GetMysqlPackage(relational_db._MYSQL_CLIENT_PACKAGES)
+    mock_parse.assert_called_once_with('5.7.16')
+
+
+class VmsToBootTest(pkb_common_test_case.PkbCommonTestCase):
+
+  VM_GROUPS = {'clients': 'c', 'default': 'd', 'servers': 's', 'other': 'o'}
+
+  def testManaged(self):
+    self.assertEqual({'clients': 'c', 'default': 'd'},
+                     relational_db.VmsToBoot(self.VM_GROUPS))
+
+  @flagsaver.flagsaver(use_managed_db=False)
+  def testUnmanaged(self):
+    self.assertEqual({'clients': 'c', 'default': 'd', 'servers': 's'},
+                     relational_db.VmsToBoot(self.VM_GROUPS))
+
+
+class ConnectionStringTest(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(ConnectionStringTest, self).setUp()
+    spec = mock.Mock(
+        high_availability=False,
+        engine=relational_db.MYSQL,
+        engine_version='5.7',
+        database_username='user',
+        database_password='pass')
+    self.db = FakeRelationalDb(spec)
+    self.db.endpoint = '10.0.0.1'
+
+  def testMysqlConnectionString(self):
+    self.assertEqual('-h 10.0.0.1 -u user -ppass',
+                     self.db.MakeMysqlConnectionString())
+    self.assertEqual('-h localhost -u user -ppass',
+                     self.db.MakeMysqlConnectionString(use_localhost=True))
+
+  @flagsaver.flagsaver(use_managed_db=False)
+  def testUnmanagedMysqlConnectionString(self):
+    db = FakeRelationalDb(
+        mock.Mock(
+            high_availability=False,
+            engine=relational_db.MYSQL,
+            engine_version='5.7'))
+    db.endpoint = '10.0.0.1'
+    self.assertEqual('-h 10.0.0.1 -P 3306 -u root -pperfkitbenchmarker',
+                     db.MakeMysqlConnectionString())
+
+  def testPsqlConnectionString(self):
+    self.assertEqual("'host=10.0.0.1 user=user password=pass dbname=db'",
+                     self.db.MakePsqlConnectionString('db'))
+
+  def testSysbenchConnectionString(self):
+    self.assertEqual(
+        '--mysql-host=10.0.0.1 --mysql-user=user --mysql-password="pass" ',
+        self.db.MakeSysbenchConnectionString())
+
+  def testConnectionStringTracksChanges(self):
+    self.db.MakeMysqlConnectionString()
+    self.db.endpoint = '10.0.0.2'
+    self.db.spec.database_username = 'user@server'
+    self.assertEqual('-h 10.0.0.2 -u user@server -ppass',
+                     self.db.MakeMysqlConnectionString())
+
+
+class UnmanagedMysqlTest(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(UnmanagedMysqlTest, self).setUp()
+    FLAGS.use_managed_db = False
+    self.db = FakeRelationalDb(
+        mock.Mock(
+            high_availability=False,
+            engine=relational_db.MYSQL,
+            engine_version='5.7'))
+    self.db.server_vm = mock.Mock()
+
+  def testPrepareDataDirectoriesBatchesCommands(self):
+    self.db._PrepareDataDirectories('/etc/mysql/my.cnf')
+    self.assertEqual(2, self.db.server_vm.RemoteCommand.call_count)
+    cmd = self.db.server_vm.RemoteCommand.call_args_list[0][0][0]
+    self.assertStartsWith(cmd, 'sudo mkdir -p /scratch/mysql && ')
+    self.assertIn(' && sudo systemctl restart apparmor && ', cmd)
+    self.assertEndsWith(
+        cmd, ' && sudo sed -i '
+        '-e "s|datadir\t\t= /var/lib/mysql|datadir\t\t= /scratch/mysql|g" '
+        '-e "s|tmpdir\t\t= /tmp|tmpdir\t\t= /scratch/tmp|g" '
+        '/etc/mysql/my.cnf')
+    self.db.server_vm.RemoteCommand.assert_called_with('df', should_log=True)
+
+  @flagsaver.flagsaver(db_flags=['max_connections=100', 'autocommit=0'])
+  def testApplyMySqlFlags(self):
+    # The mysql client prints a password warning on every call.
+    self.db.server_vm.RemoteCommandWithReturnCode.return_value = (
+        '', 'Warning: Using a password on the command line interface can be '
+        'insecure.', 0)
+    self.db._ApplyMySqlFlags()
+    connection_string = '-h localhost -P 3306 -u root -pperfkitbenchmarker'
+    self.assertEqual([
+        mock.call('mysql %s -e "SET max_connections=100;"' % connection_string,
+                  ignore_failure=True),
+        mock.call('mysql %s -e "SET autocommit=0;"' % connection_string,
+                  ignore_failure=True),
+    ], self.db.server_vm.RemoteCommandWithReturnCode.call_args_list)
+
+  @flagsaver.flagsaver(db_flags=['bogus=1'])
+  def testApplyMySqlFlagsInvalid(self):
+    self.db.server_vm.RemoteCommandWithReturnCode.return_value = (
+        '', 'error', 1)
+    with self.assertRaisesRegex(Exception, 'Invalid MySQL flags: error'):
+      self.db._ApplyMySqlFlags()
+
+
+class GetResourceMetadataTest(pkb_common_test_case.PkbCommonTestCase):
+
+  def _CreateDb(self, db_spec, client_vm_spec):
+    spec = mock.Mock(
+        high_availability=False,
+        engine=relational_db.MYSQL,
+        engine_version='5.7',
+        db_spec=db_spec)
+    spec.vm_groups = {'clients': mock.Mock(vm_spec=client_vm_spec)}
+    db = FakeRelationalDb(spec)
+    db.instance_id = 'pkb-db-123'
+    return db
+
+  def testMachineType(self):
+    db = self._CreateDb(
+        mock.Mock(spec=['zone', 'machine_type'], machine_type='db-n1'),
+        mock.Mock(spec=['zone', 'machine_type'], machine_type='n1'))
+    metadata = db.GetResourceMetadata()
+    self.assertEqual('db-n1', metadata['machine_type'])
+    self.assertEqual('n1', metadata['client_vm_machine_type'])
+    self.assertNotIn('cpus', metadata)
+
+  def testCustomMachineType(self):
+    db = self._CreateDb(
+        mock.Mock(spec=['zone', 'machine_type', 'cpus', 'memory'],
+                  machine_type=None, cpus=2, memory='8GiB'),
+        mock.Mock(spec=['zone', 'cpus', 'memory'], cpus=4, memory='16GiB'))
+    metadata = db.GetResourceMetadata()
+    self.assertEqual(2, metadata['cpus'])
+    self.assertEqual('8GiB', metadata['memory'])
+    self.assertEqual(4, metadata['client_vm_cpus'])
+    self.assertEqual('16GiB', metadata['client_vm_memory'])
+
+  def testUnsetCustomMachineType(self):
+    # gcloud picks a default machine type when none is given.
+    db = self._CreateDb(
+        mock.Mock(spec=['zone', 'machine_type', 'cpus', 'memory'],
+                  machine_type=None, cpus=None, memory=None),
+        mock.Mock(spec=['zone', 'machine_type'], machine_type='n1'))
+    metadata = db.GetResourceMetadata()
+    self.assertIsNone(metadata['cpus'])
+    self.assertIsNone(metadata['memory'])
+
+  def testTier(self):
+    db = self._CreateDb(
+        mock.Mock(spec=['zone', 'tier', 'compute_units'], tier='Basic',
+                  compute_units=None),
+        mock.Mock(spec=['zone', 'machine_type'], machine_type='n1'))
+    metadata = db.GetResourceMetadata()
+    self.assertEqual('Basic', metadata['tier'])
+    self.assertIsNone(metadata['compute_units'])
+
+  def testTierWithoutComputeUnits(self):
+    db = self._CreateDb(
+        mock.Mock(spec=['zone', 'tier'], tier='Basic'),
+        mock.Mock(spec=['zone', 'machine_type'], machine_type='n1'))
+    with self.assertRaises(relational_db.RelationalDbPropertyNotSet):
+      db.GetResourceMetadata()
+
+  def testMissingMachineType(self):
+    db = self._CreateDb(
+        mock.Mock(spec=['zone']),
+        mock.Mock(spec=['zone', 'machine_type'], machine_type='n1'))
+    with self.assertRaises(relational_db.RelationalDbPropertyNotSet):
+      db.GetResourceMetadata()
+
+
+if __name__ == '__main__':
+  unittest.main()